@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""
+Command-line analytics export, for running large exports outside the API workers
+
+Usage (from /backend):
+    python export_cli.py karma_actions --since 2025-01-01T00:00:00
+"""
+
+import asyncio
+from datetime import datetime
+from typing import Optional
+
+import typer
+
+from server import ExportCollection, plan_export, write_export
+
+
+def main(
+    collection: ExportCollection,
+    since: Optional[datetime] = typer.Option(
+        None,
+        help="Watermark returned by the previous export",
+        formats=["%Y-%m-%dT%H:%M:%S.%f", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d"],
+    ),
+):
+    """Export a collection to a Parquet file and print the result as JSON"""
+    export = asyncio.run(write_export(plan_export(collection, since)))
+    typer.echo(export.json())
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -1,14 +1,21 @@
 from fastapi import FastAPI, APIRouter, HTTPException, Depends
 from dotenv import load_dotenv
+from fastapi.responses import FileResponse
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReadPreference
+import pyarrow as pa
+import pyarrow.parquet as pq
+import asyncio
+import fcntl
+import json
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field
 from typing import List, Optional
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta
 from enum import Enum
 
 
@@ -20,6 +27,18 @@ mongo_url = os.environ['MONGO_URL']
 client = AsyncIOMotorClient(mongo_url)
 db = client[os.environ['DB_NAME']]
 
+# Analytics export settings
+EXPORT_DIR = Path(os.environ.get('EXPORT_DIR', ROOT_DIR / 'exports'))
+EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', 5000))
+EXPORT_SAFETY_LAG = timedelta(seconds=int(os.environ.get('EXPORT_SAFETY_LAG', 60)))
+
+# Catalog snapshot settings
+CATALOG_SNAPSHOT_PATH = Path(os.environ.get('CATALOG_SNAPSHOT_PATH', ROOT_DIR / 'snapshots' / 'catalog.arrow'))
+CATALOG_SNAPSHOT_LOCK_PATH = CATALOG_SNAPSHOT_PATH.with_name(CATALOG_SNAPSHOT_PATH.name + '.lock')
+CATALOG_SNAPSHOT_MAX_DELTA = int(os.environ.get('CATALOG_SNAPSHOT_MAX_DELTA', 1000))
+CATALOG_SNAPSHOT_BATCH_SIZE = int(os.environ.get('CATALOG_SNAPSHOT_BATCH_SIZE', 5000))
+CATALOG_REFRESH_INTERVAL = int(os.environ.get('CATALOG_REFRESH_INTERVAL', 5))
+
 # Create the main app without a prefix
 app = FastAPI()
 
@@ -98,6 +117,91 @@ class KarmaAction(BaseModel):
     description: str
     timestamp: datetime = Field(default_factory=datetime.utcnow)
 
+class ExportCollection(str, Enum):
+    KARMA_ACTIONS = "karma_actions"
+    PRODUCTS = "products"
+
+class ExportResult(BaseModel):
+    collection: ExportCollection
+    path: str
+    download_url: str
+    rows: Optional[int] = None  # Set once the file has been written
+    since: Optional[datetime] = None
+    watermark: datetime  # Pass as `since` on the next export
+
+# Columnar schemas for analytics exports
+KARMA_ACTION_EXPORT_SCHEMA = pa.schema([
+    ("id", pa.string()),
+    ("user_id", pa.string()),
+    ("action_type", pa.string()),
+    ("product_id", pa.string()),
+    ("points_earned", pa.int64()),
+    ("description", pa.string()),
+    ("timestamp", pa.timestamp("us")),
+])
+
+# Ethical badges are flattened into one score/description column pair per category
+PRODUCT_EXPORT_SCHEMA = pa.schema([
+    ("id", pa.string()),
+    ("name", pa.string()),
+    ("price", pa.float64()),
+    ("original_price", pa.float64()),
+    ("description", pa.string()),
+    ("image_url", pa.string()),
+    ("category", pa.string()),
+    ("karma_points", pa.int64()),
+    ("sustainability_score", pa.int64()),
+    ("carbon_footprint", pa.string()),
+    ("alternatives", pa.list_(pa.string())),
+    ("created_at", pa.timestamp("us")),
+] + [
+    field
+    for category in EthicalCategory
+    for field in (
+        (f"badge_{category.value}_score", pa.int64()),
+        (f"badge_{category.value}_description", pa.string()),
+    )
+])
+
+EXPORT_SCHEMAS = {
+    ExportCollection.KARMA_ACTIONS: KARMA_ACTION_EXPORT_SCHEMA,
+    ExportCollection.PRODUCTS: PRODUCT_EXPORT_SCHEMA,
+}
+
+# Field used as the incremental export watermark for each collection
+EXPORT_WATERMARK_FIELDS = {
+    ExportCollection.KARMA_ACTIONS: "timestamp",
+    ExportCollection.PRODUCTS: "created_at",
+}
+
+# Bump when the snapshot layout changes so stale files are rebuilt
+CATALOG_SNAPSHOT_VERSION = 2
+CATALOG_EPOCH = datetime(1970, 1, 1)
+# Lookback when catching up, so products stamped by a worker with a slightly
+# slow clock are not missed
+CATALOG_CLOCK_SKEW = timedelta(seconds=5)
+
+CATALOG_SNAPSHOT_SCHEMA = pa.schema([
+    ("id", pa.string()),
+    ("name", pa.string()),
+    ("price", pa.float64()),
+    ("original_price", pa.float64()),
+    ("description", pa.string()),
+    ("image_url", pa.string()),
+    ("category", pa.string()),
+    ("ethical_badges", pa.list_(pa.struct([
+        ("category", pa.string()),
+        ("score", pa.int64()),
+        ("description", pa.string()),
+    ]))),
+    ("karma_points", pa.int64()),
+    ("sustainability_score", pa.int64()),
+    ("carbon_footprint", pa.string()),
+    ("alternatives", pa.list_(pa.string())),
+    ("created_at", pa.timestamp("us")),
+    ("id_order", pa.int64()),  # Row positions in id order, for binary search
+])
+
 # Mock data for initial demo
 MOCK_PRODUCTS = [
     {
@@ -245,6 +349,237 @@ async def init_mock_data():
     except Exception as e:
         print(f"Error initializing mock data: {e}")
 
+# In-memory catalog
+class CatalogState:
+    """Product catalog served from a memory-mapped snapshot plus recent changes"""
+
+    def __init__(self):
+        self.table = None  # Rows sorted by category then id
+        self.category_ranges = {}  # Category -> [start, stop) row range
+        self.watermark = CATALOG_EPOCH  # Latest created_at read back from Mongo
+        self.delta = {}  # Products created after the snapshot, by ID
+
+    def load(self, path: Path) -> bool:
+        """Map a snapshot read-only; return False if it is missing or outdated"""
+        try:
+            reader = pa.ipc.open_file(pa.memory_map(str(path), "r"))
+        except (FileNotFoundError, pa.ArrowInvalid):
+            return False
+        metadata = reader.schema.metadata or {}
+        if metadata.get(b"version") != str(CATALOG_SNAPSHOT_VERSION).encode():
+            return False
+        # Column buffers point into the mapping, so pages are shared between workers
+        self.table = reader.read_all()
+        self.category_ranges = json.loads(metadata[b"category_ranges"])
+        self.watermark = datetime.fromisoformat(metadata[b"watermark"].decode())
+        self.delta = {}
+        return True
+
+    def replace(self, other: "CatalogState"):
+        """Switch to another state in one step"""
+        self.table = other.table
+        self.category_ranges = other.category_ranges
+        self.watermark = other.watermark
+        self.delta = other.delta
+
+    def add(self, product: Product):
+        """Record a product created after the snapshot"""
+        # Without a snapshot every lookup goes to Mongo, so there is nothing to track
+        if self.table is None:
+            return
+        # Leave the watermark alone: a local create says nothing about what
+        # other workers inserted before it
+        self.delta[product.id] = product
+
+    def find_row(self, product_id: str) -> Optional[int]:
+        """Binary search the snapshot's id_order index for a product's row"""
+        if self.table is None:
+            return None
+        ids = self.table.column("id")
+        id_order = self.table.column("id_order")
+        lo, hi = 0, self.table.num_rows
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if ids[id_order[mid].as_py()].as_py() < product_id:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.table.num_rows:
+            row = id_order[lo].as_py()
+            if ids[row].as_py() == product_id:
+                return row
+        return None
+
+    def get(self, product_id: str) -> Optional[Product]:
+        """Look up a product by ID"""
+        if product_id in self.delta:
+            return self.delta[product_id]
+        row = self.find_row(product_id)
+        if row is None:
+            return None
+        return Product(**self.table.slice(row, 1).to_pylist()[0])
+
+    def by_category(self, category: str, limit: int = 1000) -> List[Product]:
+        """List up to `limit` products in a category, snapshot rows in id order first"""
+        products = []
+        if self.table is not None and category in self.category_ranges:
+            start, stop = self.category_ranges[category]
+            # Read past the limit by the delta size in case delta entries replace rows
+            rows = self.table.slice(start, min(stop - start, limit + len(self.delta))).to_pylist()
+            products = [Product(**row) for row in rows if row["id"] not in self.delta]
+        products.extend(p for p in self.delta.values() if p.category == category)
+        return products[:limit]
+
+    def catch_up_query(self) -> dict:
+        # Look back a little so products stamped by a slow clock are not missed
+        return {"created_at": {"$gt": self.watermark - CATALOG_CLOCK_SKEW}}
+
+    async def pending(self) -> int:
+        """Count products that catching up would have to fetch"""
+        return await db.products.count_documents(self.catch_up_query())
+
+    async def catch_up(self):
+        """Pull products created since the watermark into the delta"""
+        if self.table is None:
+            return
+        async for doc in db.products.find(self.catch_up_query(), {"_id": 0}):
+            if doc["id"] not in self.delta and self.find_row(doc["id"]) is None:
+                self.add(Product(**doc))
+            self.watermark = max(self.watermark, doc["created_at"])
+
+catalog = CatalogState()
+
+def acquire_catalog_lock() -> Optional[int]:
+    """Take the snapshot build lock without waiting; None if another worker holds it"""
+    # flock is dropped by the kernel if the builder dies, so a lock is never stale
+    # however long a build runs, and the lock file itself is never removed
+    CATALOG_SNAPSHOT_LOCK_PATH.parent.mkdir(parents=True, exist_ok=True)
+    fd = os.open(CATALOG_SNAPSHOT_LOCK_PATH, os.O_CREAT | os.O_WRONLY)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return None
+    return fd
+
+def release_catalog_lock(fd: int):
+    """Release the snapshot build lock"""
+    fcntl.flock(fd, fcntl.LOCK_UN)
+    os.close(fd)
+
+def write_catalog_batch(writer: pa.ipc.RecordBatchFileWriter, rows: List[dict], id_order: List[int]):
+    """Append one record batch of products and the matching slice of id_order"""
+    rows = [dict(row, id_order=position) for row, position in zip(rows, id_order)]
+    writer.write_batch(pa.RecordBatch.from_pylist(rows, schema=CATALOG_SNAPSHOT_SCHEMA))
+
+async def build_catalog_snapshot(path: Path) -> int:
+    """Stream the products collection and its lookup indexes into an Arrow IPC file"""
+    # Stop short of now; products still being inserted are left to catch_up
+    watermark = datetime.utcnow() - CATALOG_CLOCK_SKEW
+    query = {"created_at": {"$lte": watermark}}
+
+    # Per-category counts give each category's row range in (category, id) order
+    counts = await db.products.aggregate([
+        {"$match": query},
+        {"$group": {"_id": "$category", "count": {"$sum": 1}}},
+        {"$sort": {"_id": 1}},
+    ]).to_list(None)
+    category_ranges = {}
+    total = 0
+    for entry in counts:
+        category_ranges[entry["_id"]] = (total, total + entry["count"])
+        total += entry["count"]
+
+    rows_cursor = db.products.find(query, {"_id": 0}).sort(
+        [("category", 1), ("id", 1)]
+    ).batch_size(CATALOG_SNAPSHOT_BATCH_SIZE)
+    # Walking products in id order gives each one's rank within its category, and
+    # so its row position, without holding the catalog in memory
+    ids_cursor = db.products.find(query, {"_id": 0, "id": 1, "category": 1}).sort(
+        "id", 1
+    ).batch_size(CATALOG_SNAPSHOT_BATCH_SIZE)
+    ranks = dict.fromkeys(category_ranges, 0)
+
+    schema = CATALOG_SNAPSHOT_SCHEMA.with_metadata({
+        "version": str(CATALOG_SNAPSHOT_VERSION),
+        "watermark": watermark.isoformat(),
+        "category_ranges": json.dumps(category_ranges),
+    })
+    # Write beside the target and rename so mapped readers never see a partial file
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    written = 0
+    try:
+        with pa.OSFile(str(tmp_path), "wb") as sink:
+            with pa.ipc.new_file(sink, schema) as writer:
+                while True:
+                    rows = await rows_cursor.to_list(CATALOG_SNAPSHOT_BATCH_SIZE)
+                    if not rows:
+                        break
+                    id_order = []
+                    for doc in await ids_cursor.to_list(len(rows)):
+                        start, _ = category_ranges[doc["category"]]
+                        id_order.append(start + ranks[doc["category"]])
+                        ranks[doc["category"]] += 1
+                    if len(id_order) != len(rows):
+                        raise RuntimeError("Products changed while building the catalog snapshot")
+                    await asyncio.to_thread(write_catalog_batch, writer, rows, id_order)
+                    written += len(rows)
+        if written != total:
+            raise RuntimeError("Products changed while building the catalog snapshot")
+    except Exception:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    tmp_path.replace(path)
+    return written
+
+async def sync_catalog_snapshot(rebuild: bool = True):
+    """Map the newest snapshot on disk, rebuilding it if missing or too far behind"""
+    state = CatalogState()
+    if state.load(CATALOG_SNAPSHOT_PATH) and await state.pending() <= CATALOG_SNAPSHOT_MAX_DELTA:
+        await state.catch_up()
+        catalog.replace(state)
+        return
+    if not rebuild:
+        return
+    # Only one worker rebuilds; the others keep their current state, or fall
+    # back to Mongo, until the new snapshot lands
+    lock = acquire_catalog_lock()
+    if lock is None:
+        return
+    try:
+        count = await build_catalog_snapshot(CATALOG_SNAPSHOT_PATH)
+    finally:
+        release_catalog_lock(lock)
+    logger.info(f"Wrote catalog snapshot with {count} products")
+    state = CatalogState()
+    if state.load(CATALOG_SNAPSHOT_PATH):
+        await state.catch_up()
+        catalog.replace(state)
+
+async def refresh_catalog():
+    """Catch up on new products and re-snapshot once the delta grows too large"""
+    while True:
+        try:
+            await catalog.catch_up()
+            if catalog.table is None or len(catalog.delta) > CATALOG_SNAPSHOT_MAX_DELTA:
+                await sync_catalog_snapshot()
+        except Exception as e:
+            logger.error(f"Error refreshing catalog: {e}")
+        await asyncio.sleep(CATALOG_REFRESH_INTERVAL)
+
+async def load_catalog():
+    """Index the catalog and map its snapshot if one is usable"""
+    try:
+        await db.products.create_index("created_at")
+        await db.products.create_index("id")
+        await db.products.create_index([("category", 1), ("id", 1)])
+        # Never build during startup, so boot time doesn't grow with the catalog;
+        # the refresher rebuilds in the background while requests fall back to Mongo
+        await sync_catalog_snapshot(rebuild=False)
+    except Exception as e:
+        logger.error(f"Error loading catalog snapshot: {e}")
+
 # Add your routes to the router instead of directly to app
 @api_router.get("/")
 async def root():
@@ -273,6 +608,10 @@ async def get_products():
 @api_router.get("/products/{product_id}", response_model=Product)
 async def get_product(product_id: str):
     """Get a specific product by ID"""
+    product = catalog.get(product_id)
+    if product:
+        return product
+    # Fall back to Mongo for products created by other workers
     product = await db.products.find_one({"id": product_id})
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
@@ -283,11 +622,14 @@ async def create_product(product_data: ProductCreate):
     """Create a new product"""
     product = Product(**product_data.dict())
     await db.products.insert_one(product.dict())
+    catalog.add(product)
     return product
 
 @api_router.get("/products/category/{category}")
 async def get_products_by_category(category: str):
     """Get products by category"""
+    if catalog.table is not None:
+        return catalog.by_category(category)
     products = await db.products.find({"category": category}).to_list(1000)
     return [Product(**product) for product in products]
 
@@ -341,6 +683,115 @@ async def get_karma_history(user_id: str):
     karma_actions = await db.karma_actions.find({"user_id": user_id}).to_list(1000)
     return [KarmaAction(**action) for action in karma_actions]
 
+# Analytics export endpoints
+def export_row(doc: dict, schema: pa.Schema) -> dict:
+    """Flatten a Mongo document into a row matching the export schema"""
+    row = {name: doc.get(name) for name in schema.names}
+    for badge in doc.get("ethical_badges") or []:
+        # Mongo returns plain strings; EthicalCategory members format as their name
+        category = badge.get("category")
+        category = getattr(category, "value", category)
+        if f"badge_{category}_score" in row:
+            row[f"badge_{category}_score"] = badge.get("score")
+            row[f"badge_{category}_description"] = badge.get("description")
+    return row
+
+def write_export_batch(writer: pq.ParquetWriter, docs: List[dict], schema: pa.Schema) -> int:
+    """Flatten a batch of documents and write it as one row group"""
+    rows = [export_row(doc, schema) for doc in docs]
+    writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+    return len(rows)
+
+def plan_export(collection: ExportCollection, since: Optional[datetime] = None) -> ExportResult:
+    """Fix the watermark and file name for an export"""
+    # Bound the export behind its start time so documents stamped before the
+    # watermark but not yet committed or replicated are picked up next time
+    watermark = datetime.utcnow() - EXPORT_SAFETY_LAG
+    path = EXPORT_DIR / f"{collection.value}-{watermark:%Y%m%dT%H%M%S%f}.parquet"
+    return ExportResult(
+        collection=collection,
+        path=str(path),
+        download_url=f"/api/exports/files/{path.name}",
+        since=since,
+        watermark=watermark,
+    )
+
+async def write_export(export: ExportResult) -> ExportResult:
+    """Stream a planned export into its Parquet file in fixed-size batches"""
+    schema = EXPORT_SCHEMAS[export.collection]
+    watermark_field = EXPORT_WATERMARK_FIELDS[export.collection]
+    query = {watermark_field: {"$lte": export.watermark}}
+    if export.since is not None:
+        query[watermark_field]["$gt"] = export.since
+
+    # Keep reporting reads off the primary when secondaries are available
+    source = db.get_collection(
+        export.collection.value, read_preference=ReadPreference.SECONDARY_PREFERRED
+    )
+    cursor = source.find(query, {"_id": 0}).batch_size(EXPORT_BATCH_SIZE)
+
+    path = Path(export.path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".parquet.tmp")
+
+    # Conversion and writing run off the event loop so live requests aren't blocked
+    docs = []
+    row_count = 0
+    writer = pq.ParquetWriter(tmp_path, schema)
+    try:
+        async for doc in cursor:
+            docs.append(doc)
+            if len(docs) >= EXPORT_BATCH_SIZE:
+                row_count += await asyncio.to_thread(write_export_batch, writer, docs, schema)
+                docs = []
+        if docs:
+            row_count += await asyncio.to_thread(write_export_batch, writer, docs, schema)
+    except Exception:
+        writer.close()
+        tmp_path.unlink(missing_ok=True)
+        raise
+    writer.close()
+    tmp_path.replace(path)
+
+    logger.info(f"Exported {row_count} {export.collection.value} rows to {path}")
+    export.rows = row_count
+    return export
+
+# Running export jobs; referenced so they aren't garbage collected mid-export
+export_jobs = set()
+
+async def run_export_job(export: ExportResult):
+    """Write an export in the background, logging failures"""
+    try:
+        await write_export(export)
+    except Exception as e:
+        logger.error(f"Error exporting {export.collection.value} to {export.path}: {e}")
+
+@api_router.post("/exports/{collection}", response_model=ExportResult, status_code=202)
+async def export_collection(collection: ExportCollection, since: Optional[datetime] = None):
+    """Start exporting a collection to Parquet and return its watermark right away"""
+    export = plan_export(collection, since)
+    job = asyncio.create_task(run_export_job(export.copy()))
+    export_jobs.add(job)
+    job.add_done_callback(export_jobs.discard)
+    return export
+
+@api_router.get("/exports/files/{filename}")
+async def download_export(filename: str):
+    """Download a finished export file"""
+    path = EXPORT_DIR / filename
+    if Path(filename).name != filename or path.suffix != ".parquet" or not path.is_file():
+        raise HTTPException(status_code=404, detail="Export not found")
+    return FileResponse(path, media_type="application/vnd.apache.parquet", filename=filename)
+
+async def create_export_indexes():
+    """Index the watermark fields used by incremental exports"""
+    try:
+        for collection, field in EXPORT_WATERMARK_FIELDS.items():
+            await db[collection.value].create_index(field)
+    except Exception as e:
+        logger.error(f"Error creating export indexes: {e}")
+
 # Include the router in the main app
 app.include_router(api_router)
 
@@ -361,9 +812,14 @@ logger = logging.getLogger(__name__)
 
 @app.on_event("startup")
 async def startup_event():
-    """Initialize mock data on startup"""
+    """Initialize mock data and map the catalog snapshot on startup"""
     await init_mock_data()
+    await create_export_indexes()
+    await load_catalog()
+    # Keep a reference so the refresher isn't garbage collected
+    app.state.catalog_refresher = asyncio.create_task(refresh_catalog())
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    app.state.catalog_refresher.cancel()
     client.close()
\ No newline at end of file
@@ -0,0 +1,90 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+
+class FakeCursor:
+    """Async cursor over an in-memory list of documents"""
+
+    def __init__(self, docs):
+        self.docs = list(docs)
+
+    def batch_size(self, size):
+        return self
+
+    def sort(self, keys, direction=None):
+        if isinstance(keys, str):
+            keys = [(keys, direction or 1)]
+        for field, order in reversed(keys):
+            self.docs.sort(key=lambda doc: doc[field], reverse=order < 0)
+        return self
+
+    async def to_list(self, length):
+        batch = self.docs if length is None else self.docs[:length]
+        self.docs = self.docs[len(batch):]
+        return batch
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self.docs:
+            raise StopAsyncIteration
+        return self.docs.pop(0)
+
+
+OPERATORS = {
+    "$gt": lambda value, bound: value > bound,
+    "$lte": lambda value, bound: value <= bound,
+}
+
+
+def matches(doc, query):
+    """Evaluate the range queries used by the backend against a document"""
+    return all(
+        OPERATORS[op](doc[field], bound)
+        for field, condition in (query or {}).items()
+        for op, bound in condition.items()
+    )
+
+
+class FakeCollection:
+    """Collection double recording the queries it receives"""
+
+    def __init__(self, docs):
+        self.docs = docs
+        self.queries = []
+
+    def find(self, query=None, projection=None):
+        self.queries.append(query)
+        return FakeCursor(doc for doc in self.docs if matches(doc, query))
+
+    async def create_index(self, keys):
+        pass
+
+    async def count_documents(self, query):
+        return sum(1 for doc in self.docs if matches(doc, query))
+
+    def aggregate(self, pipeline):
+        """Support the $match / $group count / $sort pipeline used for snapshots"""
+        match, group, _ = pipeline
+        counts = {}
+        for doc in self.docs:
+            if matches(doc, match["$match"]):
+                key = doc[group["$group"]["_id"].lstrip("$")]
+                counts[key] = counts.get(key, 0) + 1
+        return FakeCursor({"_id": key, "count": count} for key, count in counts.items()).sort("_id", 1)
+
+
+class FakeDatabase:
+    """Database double handing out fake collections by name"""
+
+    def __init__(self, **collections):
+        self.collections = {name: FakeCollection(docs) for name, docs in collections.items()}
+
+    def __getattr__(self, name):
+        return self.collections[name]
+
+    def get_collection(self, name, **kwargs):
+        return self.collections[name]
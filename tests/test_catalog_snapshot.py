@@ -0,0 +1,149 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pyarrow as pa
+import pytest
+
+import server
+from tests.conftest import FakeDatabase
+
+
+@pytest.fixture
+def products():
+    created_at = datetime(2025, 1, 1)
+    return [
+        server.Product(**dict(data, created_at=created_at)).dict()
+        for data in server.MOCK_PRODUCTS
+    ]
+
+
+@pytest.fixture
+def snapshot_path(monkeypatch, tmp_path, products):
+    monkeypatch.setattr(server, "db", FakeDatabase(products=products))
+    # Small batches so the id_order index spans several record batches
+    monkeypatch.setattr(server, "CATALOG_SNAPSHOT_BATCH_SIZE", 3)
+    path = tmp_path / "catalog.arrow"
+    assert asyncio.run(server.build_catalog_snapshot(path)) == len(products)
+    return path
+
+
+def test_get_finds_every_product(snapshot_path, products):
+    state = server.CatalogState()
+    assert state.load(snapshot_path)
+
+    for product in products:
+        assert state.get(product["id"]).name == product["name"]
+
+
+@pytest.mark.parametrize("product_id", ["", "0", "not-a-product", "~"])
+def test_get_misses_unknown_product(snapshot_path, product_id):
+    state = server.CatalogState()
+    assert state.load(snapshot_path)
+
+    assert state.get(product_id) is None
+
+
+def test_category_ranges(snapshot_path, products):
+    state = server.CatalogState()
+    assert state.load(snapshot_path)
+
+    categories = sorted({product["category"] for product in products})
+    assert list(state.category_ranges) == categories
+    for category in categories:
+        expected = sorted(p["id"] for p in products if p["category"] == category)
+        assert [p.id for p in state.by_category(category)] == expected
+    assert state.by_category("Unknown") == []
+
+
+def test_delta_overrides_snapshot_row(snapshot_path, products):
+    state = server.CatalogState()
+    assert state.load(snapshot_path)
+    original = products[0]
+    updated = server.Product(**dict(original, name="Renamed", created_at=datetime(2025, 2, 1)))
+
+    state.add(updated)
+
+    assert state.get(original["id"]).name == "Renamed"
+    listed = [p for p in state.by_category(original["category"]) if p.id == original["id"]]
+    assert [p.name for p in listed] == ["Renamed"]
+
+
+def test_load_rejects_other_versions(snapshot_path, tmp_path):
+    reader = pa.ipc.open_file(pa.memory_map(str(snapshot_path), "r"))
+    table = reader.read_all()
+    metadata = {**table.schema.metadata, b"version": b"1"}
+    old_path = tmp_path / "old.arrow"
+    with pa.OSFile(str(old_path), "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema.with_metadata(metadata)) as writer:
+            writer.write_table(table)
+
+    assert not server.CatalogState().load(old_path)
+    assert not server.CatalogState().load(tmp_path / "missing.arrow")
+
+
+def test_by_category_respects_limit(snapshot_path):
+    state = server.CatalogState()
+    assert state.load(snapshot_path)
+
+    assert len(state.by_category("Beverages")) == 2
+    assert len(state.by_category("Beverages", limit=1)) == 1
+
+
+def test_catch_up_after_local_create_keeps_other_workers_products(snapshot_path, products):
+    state = server.CatalogState()
+    assert state.load(snapshot_path)
+    template = dict(products[0], alternatives=[])
+    # Another worker inserts a product, then this worker creates one well after it
+    remote = server.Product(**dict(template, id="remote", created_at=state.watermark + timedelta(seconds=1)))
+    local = server.Product(**dict(template, id="local", created_at=state.watermark + timedelta(seconds=60)))
+    server.db.products.docs.extend([remote.dict(), local.dict()])
+    assert asyncio.run(state.pending()) == 2
+
+    state.add(local)
+    asyncio.run(state.catch_up())
+
+    listed = {p.id for p in state.by_category(template["category"])}
+    assert {"remote", "local"} <= listed
+    assert state.watermark == local.created_at
+
+
+@pytest.fixture
+def worker_catalog(monkeypatch, tmp_path, products):
+    monkeypatch.setattr(server, "db", FakeDatabase(products=products))
+    monkeypatch.setattr(server, "CATALOG_SNAPSHOT_PATH", tmp_path / "catalog.arrow")
+    monkeypatch.setattr(server, "CATALOG_SNAPSHOT_LOCK_PATH", tmp_path / "catalog.arrow.lock")
+    monkeypatch.setattr(server, "catalog", server.CatalogState())
+    return server.catalog
+
+
+def test_load_catalog_does_not_build_at_startup(worker_catalog):
+    asyncio.run(server.load_catalog())
+
+    assert worker_catalog.table is None
+    assert not server.CATALOG_SNAPSHOT_PATH.exists()
+
+
+def test_sync_builds_snapshot_then_startup_maps_it(worker_catalog, products):
+    asyncio.run(server.sync_catalog_snapshot())
+    assert worker_catalog.table.num_rows == len(products)
+
+    booted = server.CatalogState()
+    server.catalog = booted
+    asyncio.run(server.load_catalog())
+
+    assert booted.table.num_rows == len(products)
+    assert asyncio.run(booted.pending()) == 0
+
+
+def test_sync_skips_build_while_another_worker_holds_the_lock(worker_catalog, products):
+    lock = server.acquire_catalog_lock()
+    try:
+        assert server.acquire_catalog_lock() is None
+        asyncio.run(server.sync_catalog_snapshot())
+        assert worker_catalog.table is None
+        assert not server.CATALOG_SNAPSHOT_PATH.exists()
+    finally:
+        server.release_catalog_lock(lock)
+
+    asyncio.run(server.sync_catalog_snapshot())
+    assert worker_catalog.table.num_rows == len(products)
@@ -0,0 +1,89 @@
+import asyncio
+from datetime import datetime
+from pathlib import Path
+
+import pyarrow.parquet as pq
+
+import server
+from tests.conftest import FakeDatabase
+
+
+def karma_action(index):
+    return {
+        "id": f"action-{index}",
+        "user_id": "user-1",
+        "action_type": "manual",
+        "product_id": None,
+        "points_earned": index,
+        "description": "Test action",
+        "timestamp": datetime(2025, 1, 1, 12, index),
+    }
+
+
+def test_export_row_flattens_badges():
+    doc = {
+        "id": "product-1",
+        "name": "Fair Trade Coffee Beans",
+        "ethical_badges": [
+            {"category": "fair_trade", "score": 98, "description": "Fair Trade certified"},
+            {"category": server.EthicalCategory.ORGANIC, "score": 87, "description": "Organic farming"},
+            {"category": "unknown", "score": 10, "description": "Not exported"},
+            {"score": 5, "description": "No category"},
+        ],
+    }
+
+    row = server.export_row(doc, server.PRODUCT_EXPORT_SCHEMA)
+
+    assert row["badge_fair_trade_score"] == 98
+    assert row["badge_fair_trade_description"] == "Fair Trade certified"
+    assert row["badge_organic_score"] == 87
+    assert row["badge_sustainable_score"] is None
+    assert set(row) == set(server.PRODUCT_EXPORT_SCHEMA.names)
+
+
+def test_export_row_without_badges():
+    row = server.export_row({"id": "product-1", "name": "Plain"}, server.PRODUCT_EXPORT_SCHEMA)
+
+    assert row["id"] == "product-1"
+    for category in server.EthicalCategory:
+        assert row[f"badge_{category.value}_score"] is None
+        assert row[f"badge_{category.value}_description"] is None
+
+
+def test_write_export_writes_one_row_group_per_batch(monkeypatch, tmp_path):
+    fake_db = FakeDatabase(karma_actions=[karma_action(i) for i in range(7)])
+    monkeypatch.setattr(server, "db", fake_db)
+    monkeypatch.setattr(server, "EXPORT_DIR", tmp_path)
+    monkeypatch.setattr(server, "EXPORT_BATCH_SIZE", 3)
+    since = datetime(2025, 1, 1)
+
+    export = server.plan_export(server.ExportCollection.KARMA_ACTIONS, since=since)
+    result = asyncio.run(server.write_export(export))
+
+    assert result.rows == 7
+    assert result.download_url.endswith(result.path.rsplit("/", 1)[-1])
+    parquet = pq.ParquetFile(result.path)
+    assert parquet.metadata.num_rows == 7
+    assert parquet.metadata.num_row_groups == 3
+    assert parquet.read().column("points_earned").to_pylist() == list(range(7))
+    assert fake_db.karma_actions.queries == [
+        {"timestamp": {"$lte": result.watermark, "$gt": since}}
+    ]
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_export_collection_returns_before_the_file_is_written(monkeypatch, tmp_path):
+    monkeypatch.setattr(server, "db", FakeDatabase(karma_actions=[karma_action(i) for i in range(4)]))
+    monkeypatch.setattr(server, "EXPORT_DIR", tmp_path)
+
+    async def export():
+        result = await server.export_collection(server.ExportCollection.KARMA_ACTIONS)
+        assert result.rows is None
+        assert not Path(result.path).exists()
+        await asyncio.gather(*server.export_jobs)
+        return result
+
+    result = asyncio.run(export())
+
+    assert pq.ParquetFile(result.path).metadata.num_rows == 4
+    assert not server.export_jobs